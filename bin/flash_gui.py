@@ -3,23 +3,46 @@
 
 from __future__ import annotations
 
+import base64
+import collections
+import concurrent.futures
 import csv
-import glob
+import functools
+import gzip
+import hashlib
 import http.server
+import itertools
 import json
+import os
 import platform
 import re
 import shlex
 import shutil
+import socket
 import subprocess
 import threading
+import time
 import urllib.parse
 import webbrowser
 from pathlib import Path
-from typing import ClassVar
+from typing import Callable, ClassVar
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    # Optional speedup; the standard library encoder is used when it is not installed.
+    orjson = None
+
+SYSTEM = platform.system()
 PRODUCTION_DIR = Path(__file__).resolve().parent
 PASSWORD_DB_PATH = PRODUCTION_DIR / "passwords.csv"
+INDEX_HTML_PATH = PRODUCTION_DIR / "flash_gui.html"
+# The page reads its password table from this placeholder; null makes it fall back to /lookup.
+INDEX_PASSWORD_TABLE_MARKER = "/*__DB__*/null"
+# Inline the table only while it keeps the page small; larger databases stay behind /lookup.
+PASSWORD_TABLE_INLINE_MAX = 256 * 1024
+# JSON string escapes for characters the HTML parser reacts to inside <script> ("</script", "<!--").
+SCRIPT_JSON_ESCAPES = str.maketrans({"<": "\\u003c", ">": "\\u003e", "&": "\\u0026"})
 SERIAL_MIN = 1
 SERIAL_MAX = 100
 YEAR_MIN = 0
@@ -27,7 +50,40 @@ YEAR_MAX = 99
 MONTH_MIN = 1
 MONTH_MAX = 12
 IDENTIFIER_PREFIX = "CC"
-ANSI_ESCAPE = re.compile(r"\x1B\[[0-9;?]*[ -/]*[@-~]")
+PORTS_CACHE_TTL = 2.5
+PUSH_KEEPALIVE = 15.0
+STATE_WAIT_MAX = 30.0
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_OPCODE_TEXT = 0x1
+WS_OPCODE_CLOSE = 0x8
+WS_OPCODE_PING = 0x9
+WS_OPCODE_PONG = 0xA
+# Each open /ws stream and each held /state long-poll occupies a worker, so leave headroom
+# for several tabs plus their short requests.
+HTTP_WORKERS = 32
+# /dev entry patterns per OS; each alternative is its own group so match.lastindex ranks the port family.
+DARWIN_PORT_PATTERN = re.compile(r"cu\.(?:(usbserial)|(SLAB_USB)|(usbmodem)|(wchusbserial))")
+LINUX_PORT_PATTERN = re.compile(r"tty(?:(USB)|(ACM)|(S))")
+# ANSI escape sequences, stripped from raw subprocess output before decoding.
+ANSI_ESCAPE = re.compile(rb"\x1B\[[0-9;?]*[ -/]*[@-~]")
+
+
+def dump_json(payload: object) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
+def decode_output(data: bytes | bytearray) -> str:
+    """Decode raw subprocess output without ANSI escapes, with universal newlines mapped to ``\\n``."""
+    # A bare \r ends a line, as it did under text=True, so redrawn progress lines stay separate.
+    # Newlines are mapped first so an escape between \r and \n cannot merge two line breaks into one.
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    # Most esptool output has no escapes at all; a memchr-backed membership test skips the regex for it.
+    if b"\x1b" in data:
+        data = ANSI_ESCAPE.sub(b"", data)
+    return data.decode("utf-8", "replace")
 
 
 def validate_year(value: int) -> None:
@@ -44,8 +100,21 @@ def format_identifier(batch: int, year: int, month: int, serial: int) -> str:
     return f"{IDENTIFIER_PREFIX}{batch:02d}-{year:02d}{month:02d}{serial:04d}"
 
 
+def scan_dev_ports(pattern: re.Pattern[str]) -> list[str]:
+    try:
+        names = os.listdir("/dev")
+    except OSError:
+        return []
+    matches = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            matches.append((match.lastindex or 0, name))
+    matches.sort()
+    return [f"/dev/{name}" for _, name in matches]
+
+
 def detect_serial_ports() -> list[str]:
-    system = platform.system()
     ports: list[str] = []
     seen: set[str] = set()
 
@@ -54,28 +123,13 @@ def detect_serial_ports() -> list[str]:
             seen.add(path)
             ports.append(path)
 
-    if system == "Darwin":
-        patterns = [
-            "/dev/cu.usbserial-*",
-            "/dev/cu.SLAB_USB*",
-            "/dev/cu.usbmodem*",
-            "/dev/cu.wchusbserial*",
-            "/dev/cu.usbserial",
-            "/dev/cu.SLAB_USBtoUART",
-        ]
-        for pattern in patterns:
-            for path in sorted(glob.glob(pattern)):
-                add_port(path)
-    elif system == "Linux":
-        patterns = [
-            "/dev/ttyUSB*",
-            "/dev/ttyACM*",
-            "/dev/ttyS*",
-        ]
-        for pattern in patterns:
-            for path in sorted(glob.glob(pattern)):
-                add_port(path)
-    elif system == "Windows":
+    if SYSTEM == "Darwin":
+        for path in scan_dev_ports(DARWIN_PORT_PATTERN):
+            add_port(path)
+    elif SYSTEM == "Linux":
+        for path in scan_dev_ports(LINUX_PORT_PATTERN):
+            add_port(path)
+    elif SYSTEM == "Windows":
         try:
             import serial.tools.list_ports  # type: ignore
         except Exception:
@@ -106,10 +160,48 @@ def detect_serial_ports() -> list[str]:
     return ports
 
 
+_ports_lock = threading.Lock()
+_ports_cache: tuple[float, list[str]] | None = None
+
+
+def cached_serial_ports() -> list[str]:
+    """Return detect_serial_ports(), reusing results younger than PORTS_CACHE_TTL seconds."""
+    global _ports_cache
+    with _ports_lock:
+        now = time.monotonic()
+        if _ports_cache is None or now - _ports_cache[0] >= PORTS_CACHE_TTL:
+            _ports_cache = (now, detect_serial_ports())
+        return list(_ports_cache[1])
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak If-None-Match comparison: accepts ``*``, comma-separated lists, and ``W/`` validators."""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def websocket_frame(opcode: int, payload: bytes) -> bytes:
+    """Encode a single unmasked, unfragmented server-to-client WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+    return header + payload
+
+
 class PasswordDatabase:
     def __init__(self, path: Path) -> None:
         self.path = path
-        self.entries: dict[tuple[int, int], str] = {}
+        # One row per batch, indexed directly by serial (index 0 unused).
+        self.by_batch: dict[int, list[str | None]] = {}
 
     def load(self) -> None:
         if not self.path.exists():
@@ -117,27 +209,42 @@ class PasswordDatabase:
                 f"Password database not found at {self.path}. "
                 "Create passwords.csv (batch,serial,password)."
             )
+        # csv.reader streams one row at a time, and passwords may be any printable ASCII, including
+        # quoted commas, so rows are not split by hand.
         with self.path.open("r", encoding="utf-8", newline="") as fh:
-            reader = csv.DictReader(fh)
-            required = {"batch", "serial", "password"}
-            if not required.issubset(reader.fieldnames or set()):
-                raise SystemExit("Password CSV must contain batch,serial,password columns.")
-            self.entries = {}
+            reader = csv.reader(fh)
+            header = next(reader, [])
+            try:
+                idx_batch = header.index("batch")
+                idx_serial = header.index("serial")
+                idx_password = header.index("password")
+            except ValueError as exc:
+                raise SystemExit("Password CSV must contain batch,serial,password columns.") from exc
+            # Locals keep the per-row loop on LOAD_FAST instead of global/attribute lookups.
+            serial_min, serial_max = SERIAL_MIN, SERIAL_MAX
+            by_batch: dict[int, list[str | None]] = {}
             for row in reader:
+                if not row:
+                    continue
                 try:
-                    batch = int(row["batch"])
-                    serial = int(row["serial"])
+                    batch = int(row[idx_batch])
+                    serial = int(row[idx_serial])
+                    password = row[idx_password].strip()
+                except IndexError as exc:
+                    raise SystemExit(f"Incomplete row in {self.path}: {row}") from exc
                 except (TypeError, ValueError) as exc:
                     raise SystemExit(f"Invalid batch/serial value in {self.path}: {row}") from exc
-                password = row["password"].strip()
-                if not (SERIAL_MIN <= serial <= SERIAL_MAX):
-                    raise SystemExit(f"Serial {serial} out of supported range {SERIAL_MIN}-{SERIAL_MAX}.")
-                if len(password) < 8 or len(password) > 63:
+                if not (serial_min <= serial <= serial_max):
+                    raise SystemExit(f"Serial {serial} out of supported range {serial_min}-{serial_max}.")
+                if not (8 <= len(password) <= 63):
                     raise SystemExit(f"Password for batch {batch} serial {serial} violates length constraints.")
-                key = (batch, serial)
-                if key in self.entries:
+                passwords = by_batch.get(batch)
+                if passwords is None:
+                    passwords = by_batch[batch] = [None] * (serial_max + 1)
+                if passwords[serial] is not None:
                     raise SystemExit(f"Duplicate password entry for batch {batch} serial {serial:04d}.")
-                self.entries[key] = password
+                passwords[serial] = password
+        self.by_batch = by_batch
 
     def lookup(self, batch: int, serial: int, year: int, month: int) -> dict[str, object]:
         if batch <= 0:
@@ -146,10 +253,10 @@ class PasswordDatabase:
             raise ValueError(f"Serial must be between {SERIAL_MIN} and {SERIAL_MAX}.")
         validate_year(year)
         validate_month(month)
-        try:
-            password = self.entries[(batch, serial)]
-        except KeyError as exc:
-            raise ValueError(f"No password entry for batch {batch} serial {serial:04d}.") from exc
+        passwords = self.by_batch.get(batch)
+        password = passwords[serial] if passwords else None
+        if password is None:
+            raise ValueError(f"No password entry for batch {batch} serial {serial:04d}.")
         serial_suffix = format_identifier(batch, year, month, serial)
         ssid = serial_suffix
         return {
@@ -162,349 +269,53 @@ class PasswordDatabase:
             "password": password,
         }
 
+    def table(self) -> dict[str, str]:
+        """Every loaded password keyed by ``"batch:serial"``, as embedded in the page."""
+        return {
+            f"{batch}:{serial}": password
+            for batch, passwords in self.by_batch.items()
+            for serial, password in enumerate(passwords)
+            if password is not None
+        }
+
 
 PASSWORD_DB = PasswordDatabase(PASSWORD_DB_PATH)
 
-INDEX_HTML = """<!DOCTYPE html>
-<html lang="en">
-<head>
-  <meta charset="utf-8">
-  <title>Controller Flasher</title>
-  <style>
-    body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif; margin: 24px auto; width: min(600px, calc(100vw - 32px)); max-width: 600px; padding: 0 12px; box-sizing: border-box; color: #1f2933; }
-    h1 { font-size: 1.6rem; margin-bottom: 0.2rem; }
-    form { display: flex; flex-direction: column; gap: 12px; margin-bottom: 18px; }
-    label { font-weight: 600; font-size: 0.95rem; display: block; margin-bottom: 4px; }
-    input, select { padding: 8px; font-size: 1rem; border: 1px solid #c0c9d2; border-radius: 4px; width: 100%; box-sizing: border-box; background-color: #fff; }
-    input[readonly] { background-color: #f8fafc; }
-    button { padding: 10px; font-size: 1rem; border: none; border-radius: 4px; background-color: #2563eb; color: #fff; cursor: pointer; }
-    button:disabled { background-color: #9ca3af; cursor: not-allowed; }
-    .row { display: flex; gap: 12px; flex-wrap: wrap; }
-    .row > div { flex: 1; min-width: 160px; }
-    .status { display: flex; gap: 8px; align-items: center; font-weight: 500; margin-bottom: 10px; color: #475569; }
-    .status-label { font-weight: 500; }
-    .status-badge { display: inline-flex; align-items: center; gap: 8px; padding: 4px 12px; border-radius: 999px; font-size: 0.9rem; font-weight: 600; }
-    .status-ready { background-color: #e0f2fe; color: #075985; }
-    .status-flashing { background-color: #fef3c7; color: #92400e; }
-    .status-success { background-color: #dcfce7; color: #166534; }
-    .status-failed { background-color: #fee2e2; color: #b91c1c; }
-    .status-spinner { width: 12px; height: 12px; border: 2px solid transparent; border-top-color: currentColor; border-left-color: currentColor; border-radius: 50%; animation: spin 0.8s linear infinite; display: none; }
-    .status-flashing .status-spinner { display: inline-block; }
-    @keyframes spin { from { transform: rotate(0deg); } to { transform: rotate(360deg); } }
-    textarea { width: 100%; height: 320px; font-family: ui-monospace, SFMono-Regular, Consolas, monospace; border: 1px solid #c0c9d2; border-radius: 4px; padding: 8px; resize: none; box-sizing: border-box; }
-    .message { color: #b91c1c; min-height: 1.2rem; }
-    .actions { display: flex; gap: 12px; flex-wrap: wrap; }
-    .actions button { flex: none; }
-  </style>
-</head>
-<body>
-  <h1>Controller Flasher</h1>
-  <p>Provide the batch (two digits), build year/month, and inter-batch serial (001-100). Passwords are auto-assigned, and the SSID/serial will be <strong>CC&lt;batch&gt;-&lt;year&gt;&lt;month&gt;&lt;serial&gt;</strong>.</p>
-  <form id="flash-form">
-    <div class="row">
-      <div>
-        <label for="batch">Batch number</label>
-        <input id="batch" name="batch" type="number" min="1" value="1" required>
-      </div>
-      <div>
-        <label for="year">Year (YY)</label>
-        <input id="year" name="year" type="number" min="0" max="99" required>
-      </div>
-      <div>
-        <label for="month">Month (MM)</label>
-        <input id="month" name="month" type="number" min="1" max="12" required>
-      </div>
-    </div>
-    <div class="row">
-      <div>
-        <label for="serialNumber">Inter-batch serial (001-100)</label>
-        <input id="serialNumber" name="serialNumber" type="number" min="1" max="100" value="1" required>
-      </div>
-      <div style="flex:0 0 auto;align-self:flex-end;">
-        <button type="button" id="next-button">Next</button>
-      </div>
-    </div>
-    <div class="row">
-      <div>
-        <label for="serialSuffix">Serial suffix</label>
-        <input id="serialSuffix" name="serialSuffix" readonly>
-      </div>
-      <div>
-        <label for="ssid">SSID</label>
-        <input id="ssid" name="ssid" readonly>
-      </div>
-      <div>
-        <label for="password">Password</label>
-        <input id="password" name="password" readonly>
-      </div>
-    </div>
-    <div class="row">
-      <div>
-        <label for="serialPort">Serial port</label>
-        <select id="serialPort" name="serialPort">
-          <option value="auto">Auto-detect</option>
-        </select>
-      </div>
-      <div style="flex:0 0 auto;align-self:flex-end;">
-        <button type="button" id="refresh-ports">Refresh Ports</button>
-      </div>
-    </div>
-    <div class="actions">
-      <button id="flash-button" type="submit">Flash</button>
-    </div>
-    <div class="message" id="form-message"></div>
-  </form>
-  <div class="status">
-    <span class="status-label">Status:</span>
-    <span id="status" class="status-badge status-ready">
-      <span class="status-spinner" aria-hidden="true"></span>
-      <span id="status-text">Ready to flash</span>
-    </span>
-  </div>
-  <textarea id="logs" readonly placeholder="Logs will appear here..."></textarea>
-
-  <script>
-    const statusBadge = document.getElementById('status');
-    const statusTextEl = document.getElementById('status-text');
-    const logsEl = document.getElementById('logs');
-    const messageEl = document.getElementById('form-message');
-    const batchInput = document.getElementById('batch');
-    const yearInput = document.getElementById('year');
-    const monthInput = document.getElementById('month');
-    const serialInput = document.getElementById('serialNumber');
-    const serialSuffixInput = document.getElementById('serialSuffix');
-    const ssidInput = document.getElementById('ssid');
-    const passwordInput = document.getElementById('password');
-    const portSelect = document.getElementById('serialPort');
-    const refreshPortsButton = document.getElementById('refresh-ports');
-    const form = document.getElementById('flash-form');
-    const flashButton = document.getElementById('flash-button');
-    const nextButton = document.getElementById('next-button');
-    const SERIAL_MIN = 1;
-    const SERIAL_MAX = 100;
-    const STATUS_CODES = ['ready', 'flashing', 'success', 'failed'];
-    let derivedReady = false;
-    let portsLoaded = false;
-
-    function updateStatus(status) {
-      const fallback = { code: 'ready', message: 'Ready to flash' };
-      const next = (status && typeof status === 'object') ? status : fallback;
-      const code = (typeof next.code === 'string' && STATUS_CODES.includes(next.code)) ? next.code : fallback.code;
-      const message = (typeof next.message === 'string' && next.message.trim().length > 0)
-        ? next.message
-        : fallback.message;
-      statusTextEl.textContent = message;
-      statusBadge.className = `status-badge status-${code}`;
-      if (code === 'flashing') {
-        statusBadge.setAttribute('aria-busy', 'true');
-      } else {
-        statusBadge.removeAttribute('aria-busy');
-      }
-    }
-
-    function markDerivedDirty() {
-      derivedReady = false;
-      flashButton.disabled = true;
-    }
-
-    function setDefaultYearMonth() {
-      const now = new Date();
-      yearInput.value = String(now.getFullYear() % 100).padStart(2, '0');
-      monthInput.value = String(now.getMonth() + 1).padStart(2, '0');
-    }
-
-    function populatePorts(entries) {
-      const options = entries && Array.isArray(entries) ? entries : [];
-      portSelect.innerHTML = '';
-      const fragment = document.createDocumentFragment();
-      options.forEach((entry) => {
-        const option = document.createElement('option');
-        option.value = entry.path;
-        option.textContent = entry.label || entry.path;
-        fragment.appendChild(option);
-      });
-      portSelect.appendChild(fragment);
-      portsLoaded = true;
-    }
-
-    async function loadPorts({ showBusy = false } = {}) {
-      if (showBusy) {
-        refreshPortsButton.disabled = true;
-        refreshPortsButton.textContent = 'Refreshing...';
-      }
-      try {
-        const response = await fetch('/ports');
-        if (!response.ok) throw new Error('Failed to fetch ports');
-        const payload = await response.json();
-        if (payload && Array.isArray(payload.ports)) {
-          populatePorts(payload.ports);
-        } else {
-          throw new Error('Invalid response');
-        }
-      } catch (err) {
-        console.error('Port refresh failed', err);
-        populatePorts([{ path: 'auto', label: 'Auto-detect' }]);
-      } finally {
-        refreshPortsButton.disabled = false;
-        refreshPortsButton.textContent = 'Refresh Ports';
-      }
-    }
-
-    async function refreshState() {
-      try {
-        const response = await fetch('/state');
-        if (!response.ok) return;
-        const data = await response.json();
-        updateStatus(data.status);
-        const wasAtBottom = logsEl.scrollTop + logsEl.clientHeight >= logsEl.scrollHeight - 8;
-        logsEl.value = data.logs;
-        if (wasAtBottom) {
-          logsEl.scrollTop = logsEl.scrollHeight;
-        }
-        flashButton.disabled = data.busy || !derivedReady;
-      } catch (err) {
-        console.error('State poll failed', err);
-      }
-    }
-
-    async function lookupDerived() {
-      const batch = batchInput.value.trim();
-      const year = yearInput.value.trim();
-      const month = monthInput.value.trim();
-      const serial = serialInput.value.trim();
-      if (!batch || !serial || !year || !month) {
-        derivedReady = false;
-        flashButton.disabled = true;
-        serialSuffixInput.value = '';
-        ssidInput.value = '';
-        passwordInput.value = '';
-        return;
-      }
-      const yearNum = parseInt(year, 10);
-      if (Number.isNaN(yearNum) || yearNum < 0 || yearNum > 99) {
-        derivedReady = false;
-        flashButton.disabled = true;
-        messageEl.textContent = 'Year must be between 00 and 99.';
-        serialSuffixInput.value = '';
-        ssidInput.value = '';
-        passwordInput.value = '';
-        return;
-      }
-      const monthNum = parseInt(month, 10);
-      if (Number.isNaN(monthNum) || monthNum < 1 || monthNum > 12) {
-        derivedReady = false;
-        flashButton.disabled = true;
-        messageEl.textContent = 'Month must be between 01 and 12.';
-        serialSuffixInput.value = '';
-        ssidInput.value = '';
-        passwordInput.value = '';
-        return;
-      }
-      try {
-        const params = new URLSearchParams({
-          batch,
-          serial,
-          year: yearNum.toString().padStart(2, '0'),
-          month: monthNum.toString().padStart(2, '0')
-        });
-        const response = await fetch(`/lookup?${params.toString()}`);
-        const payload = await response.json();
-        if (!response.ok || !payload.ok) {
-          derivedReady = false;
-          flashButton.disabled = true;
-          messageEl.textContent = payload.error || 'Lookup failed.';
-          serialSuffixInput.value = '';
-          ssidInput.value = '';
-          passwordInput.value = '';
-          return;
-        }
-        derivedReady = true;
-        messageEl.textContent = '';
-        serialSuffixInput.value = payload.serial;
-        ssidInput.value = payload.ssid;
-        passwordInput.value = payload.password;
-        flashButton.disabled = false;
-      } catch (err) {
-        derivedReady = false;
-        flashButton.disabled = true;
-        messageEl.textContent = 'Lookup request failed. Check the terminal for details.';
-      }
-    }
-
-    function handleNext() {
-      const current = parseInt(serialInput.value, 10) || SERIAL_MIN;
-      if (current >= SERIAL_MAX) {
-        messageEl.textContent = `Reached serial ${SERIAL_MAX}. Increase the batch number to continue.`;
-        return;
-      }
-      serialInput.value = current + 1;
-      lookupDerived();
-    }
-
-    async function startFlash(event) {
-      event.preventDefault();
-      if (!derivedReady) {
-        messageEl.textContent = 'Lookup failed; cannot start flash.';
-        return;
-      }
-      messageEl.textContent = '';
-      flashButton.disabled = true;
-      const params = new URLSearchParams();
-      params.set('batch', batchInput.value.trim());
-      params.set('year', yearInput.value.trim());
-      params.set('month', monthInput.value.trim());
-      params.set('serial', serialInput.value.trim());
-      params.set('port', portSelect.value || 'auto');
-      try {
-        const response = await fetch('/flash', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-          body: params.toString()
-        });
-        const payload = await response.json();
-        if (!response.ok || !payload.ok) {
-          messageEl.textContent = payload.error || 'Unable to start flash.';
-          flashButton.disabled = false;
-        }
-      } catch (err) {
-        messageEl.textContent = 'Request failed. Check the terminal for details.';
-        flashButton.disabled = false;
-      }
-    }
-
-    form.addEventListener('submit', startFlash);
-    batchInput.addEventListener('change', lookupDerived);
-    serialInput.addEventListener('change', lookupDerived);
-    yearInput.addEventListener('change', lookupDerived);
-    monthInput.addEventListener('change', lookupDerived);
-    serialInput.addEventListener('input', markDerivedDirty);
-    batchInput.addEventListener('input', markDerivedDirty);
-    yearInput.addEventListener('input', markDerivedDirty);
-    monthInput.addEventListener('input', markDerivedDirty);
-    nextButton.addEventListener('click', handleNext);
-    refreshPortsButton.addEventListener('click', () => loadPorts({ showBusy: true }));
-    setDefaultYearMonth();
-    updateStatus({ code: 'ready', message: 'Ready to flash' });
-    populatePorts([{ path: 'auto', label: 'Auto-detect' }]);
-    loadPorts();
-    setInterval(refreshState, 1000);
-    lookupDerived();
-    refreshState();
-  </script>
-</body>
-</html>
-"""
+INDEX_HTML_TEMPLATE = INDEX_HTML_PATH.read_text(encoding="utf-8")
+# Rendered by load_password_db() once the table they embed is known.
+INDEX_HTML_BYTES = b""
+INDEX_HTML_GZIP = b""
+
+
+def render_index() -> bytes:
+    """The page with the password table inlined, or null when it exceeds PASSWORD_TABLE_INLINE_MAX."""
+    # ensure_ascii keeps U+2028/U+2029 escaped; with <, > and & escaped too, no password can end the
+    # <script> block or switch the parser into its escaped script states.
+    table = json.dumps(PASSWORD_DB.table(), separators=(",", ":")).translate(SCRIPT_JSON_ESCAPES)
+    if len(table) > PASSWORD_TABLE_INLINE_MAX:
+        table = "null"
+    return INDEX_HTML_TEMPLATE.replace(INDEX_PASSWORD_TABLE_MARKER, table, 1).encode("utf-8")
 
 
 def load_password_db() -> None:
+    global INDEX_HTML_BYTES, INDEX_HTML_GZIP
     PASSWORD_DB.load()
+    lookup_json.cache_clear()
+    INDEX_HTML_BYTES = render_index()
+    INDEX_HTML_GZIP = gzip.compress(INDEX_HTML_BYTES, 9, mtime=0)
+
+
+@functools.lru_cache(maxsize=2048)
+def lookup_json(batch: int, serial: int, year: int, month: int) -> bytes:
+    """Encoded /lookup success body; raises ValueError like PasswordDatabase.lookup."""
+    unit = PASSWORD_DB.lookup(batch, serial, year, month)
+    return dump_json({"ok": True, **unit})
 
 
 def build_flash_command(serial: str, password: str, port: str | None) -> tuple[list[str], Path]:
-    system = platform.system()
     port_arg = (port or "").strip()
     use_port = port_arg and port_arg.lower() != "auto"
-    if system == "Darwin":
+    if SYSTEM == "Darwin":
         script = PRODUCTION_DIR / "flash_main_hub.sh"
         if not script.exists():
             raise FileNotFoundError(f"macOS script not found: {script}")
@@ -512,7 +323,7 @@ def build_flash_command(serial: str, password: str, port: str | None) -> tuple[l
         if use_port:
             command.extend(["--port", port_arg])
         return command, PRODUCTION_DIR
-    if system == "Windows":
+    if SYSTEM == "Windows":
         script = PRODUCTION_DIR / "flash_main_hub.ps1"
         if not script.exists():
             raise FileNotFoundError(f"PowerShell script not found: {script}")
@@ -533,9 +344,10 @@ def build_flash_command(serial: str, password: str, port: str | None) -> tuple[l
         if use_port:
             command.extend(["-Port", port_arg])
         return command, PRODUCTION_DIR
-    raise RuntimeError(f"Unsupported operating system: {system}")
+    raise RuntimeError(f"Unsupported operating system: {SYSTEM}")
 
 
+@functools.lru_cache(maxsize=None)
 def find_powershell() -> str:
     for candidate in ("pwsh", "powershell"):
         path = shutil.which(candidate)
@@ -547,11 +359,22 @@ def find_powershell() -> str:
 class FlashManager:
     def __init__(self) -> None:
         self._lock = threading.Lock()
+        # Notified (under _lock) whenever _version changes; /ws streams wait on it.
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
         self._busy = False
         self._status_code = "ready"
         self._status_message = "Ready to flash"
-        self._logs: list[str] = []
         self._max_lines = 600
+        self._logs: collections.deque[str] = collections.deque(maxlen=self._max_lines)
+        # Absolute index of _logs[0]; /ws clients resume from an index instead of resending the buffer.
+        self._log_base = 0
+        # Joined copy of _logs, extended in place; None once trimming made it stale, rebuilt on the next read.
+        self._logs_text: str | None = ""
+        # Bumped on every mutation so serialized state can be reused between polls.
+        self._version = 0
+        # (version, encoded state), replaced as a whole so readers can check it without the lock.
+        self._state_cache: tuple[int, bytes] = (-1, b"")
 
     def start(self, batch: int, year: int, month: int, serial: int, port: str | None) -> tuple[bool, str]:
         try:
@@ -571,24 +394,61 @@ class FlashManager:
             self._busy = True
             self._status_code = "flashing"
             self._status_message = f"Flashing {serial_label}..."
-            self._logs = [
-                f"Starting flash for batch {batch:02d} serial {serial:04d} ({year_value:02d}/{month_value:02d})",
-                f"SSID: {unit['ssid']}",
-            ]
+            # Skip one index so any client cursor from the previous run falls outside the new buffer.
+            self._log_base += len(self._logs) + 1
+            self._logs = collections.deque(
+                [
+                    f"Starting flash for batch {batch:02d} serial {serial:04d} ({year_value:02d}/{month_value:02d})",
+                    f"SSID: {unit['ssid']}",
+                ],
+                maxlen=self._max_lines,
+            )
             if port_value:
                 self._logs.append(f"Port: {port_value}")
+            self._logs_text = "\n".join(self._logs)
             unit["port"] = port_value
+            self._bump_version_locked()
 
         thread = threading.Thread(target=self._run_flash, args=(unit,), daemon=True)
         thread.start()
         return True, "Flash started."
 
     def _append_log(self, message: str) -> None:
-        sanitized = ANSI_ESCAPE.sub("", message.replace("\r", ""))
+        self._append_logs([message])
+
+    def _append_logs(self, messages: list[str]) -> None:
+        """Append several lines under one lock acquisition and a single version bump."""
+        if not messages:
+            return
         with self._lock:
-            self._logs.append(sanitized)
-            if len(self._logs) > self._max_lines:
-                self._logs = self._logs[-self._max_lines :]
+            had_lines = bool(self._logs)
+            evicted = max(0, len(self._logs) + len(messages) - self._max_lines)
+            self._logs.extend(messages)
+            if evicted:
+                self._log_base += evicted
+                self._logs_text = None
+            elif self._logs_text is not None:
+                joined = "\n".join(messages)
+                self._logs_text = f"{self._logs_text}\n{joined}" if had_lines else joined
+            self._bump_version_locked()
+
+    def _pump_output(self, fd: int) -> None:
+        buffer = bytearray()
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buffer += chunk
+            # A trailing \r may be the first half of a \r\n split across reads, so it waits for the next one.
+            end = max(buffer.rfind(b"\n"), buffer.rfind(b"\r", 0, len(buffer) - 1))
+            if end == -1:
+                continue
+            # Everything a single read returned is published at once.
+            text = decode_output(buffer[: end + 1])
+            self._append_logs([line.rstrip() for line in text[:-1].split("\n")])
+            del buffer[: end + 1]
+        if buffer:
+            self._append_log(decode_output(buffer).rstrip())
 
     def _run_flash(self, unit: dict[str, object]) -> None:
         success = False
@@ -597,20 +457,23 @@ class FlashManager:
         port_value = str(unit.get("port", "") or "")
         try:
             command, workdir = build_flash_command(serial_suffix, password, port_value)
-            command_display = " ".join(shlex.quote(part) for part in command[:-1] + ["******"])
+            command_display = shlex.join([*command[:-1], "******"])
             self._append_log(f"Command: {command_display}")
             process = subprocess.Popen(
                 command,
                 cwd=str(workdir),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
+                bufsize=0,
+                # esptool and the scripts' inline Python helpers otherwise block-buffer into the pipe.
+                env={**os.environ, "PYTHONUNBUFFERED": "1"},
             )
             assert process.stdout is not None
-            for line in process.stdout:
-                self._append_log(line.rstrip())
+            pump = threading.Thread(target=self._pump_output, args=(process.stdout.fileno(),), daemon=True)
+            pump.start()
             success = process.wait() == 0
+            pump.join()
+            process.stdout.close()
         except FileNotFoundError as exc:
             self._append_log(f"Error: {exc}")
         except Exception as exc:  # noqa: BLE001
@@ -625,26 +488,110 @@ class FlashManager:
                 else:
                     self._status_code = "failed"
                     self._status_message = f"Failed flashing {serial_suffix}. Retry."
+                self._bump_version_locked()
             self._append_log(final_message)
 
-    def state(self) -> dict[str, object]:
+    def _bump_version_locked(self) -> None:
+        self._version += 1
+        self._changed.notify_all()
+
+    def state_bytes(self) -> tuple[int, bytes]:
+        cached = self._state_cache
+        if cached[0] == self._version:
+            return cached
+        with self._lock:
+            return self._state_bytes_locked()
+
+    def wait_changed(self, version: int, timeout: float) -> int:
+        """Block until the version moves past ``version`` (or timeout/close()); return the current version."""
         with self._lock:
-            return {
+            self._changed.wait_for(lambda: self._closed or self._version != version, timeout)
+            return self._version
+
+    def wait_delta_bytes(
+        self,
+        version: int,
+        since: int,
+        timeout: float,
+        cancelled: threading.Event | None = None,
+    ) -> tuple[int, int, bytes | None]:
+        """Block until the state version differs from ``version``, then encode log lines from ``since``.
+
+        Returns ``(version, next_index, body)``; body is None on timeout, after close(), or once
+        ``cancelled`` is set and wake() is called.
+        """
+
+        def stopped() -> bool:
+            return self._closed or (cancelled is not None and cancelled.is_set())
+
+        with self._lock:
+            self._changed.wait_for(lambda: stopped() or self._version != version, timeout)
+            if stopped() or self._version == version:
+                return version, since, None
+            end = self._log_base + len(self._logs)
+            reset = not (self._log_base <= since <= end)
+            lines = self._logs if reset else itertools.islice(self._logs, since - self._log_base, None)
+            payload = {
                 "status": {"code": self._status_code, "message": self._status_message},
                 "busy": self._busy,
-                "logs": "\n".join(self._logs),
+                "reset": reset,
+                "lines": list(lines),
+                "next": end,
             }
+            return self._version, end, dump_json(payload)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def wake(self) -> None:
+        """Re-check every waiting stream's predicate, e.g. after one of them was cancelled."""
+        with self._lock:
+            self._changed.notify_all()
+
+    def close(self) -> None:
+        """Release every waiting /ws stream so server worker threads can exit."""
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+
+    def _state_bytes_locked(self) -> tuple[int, bytes]:
+        if self._state_cache[0] != self._version:
+            self._state_cache = (self._version, dump_json(self._state_locked()))
+        return self._state_cache
+
+    def _state_locked(self) -> dict[str, object]:
+        if self._logs_text is None:
+            self._logs_text = "\n".join(self._logs)
+        return {
+            "status": {"code": self._status_code, "message": self._status_message},
+            "busy": self._busy,
+            "logs": self._logs_text,
+            "next": self._log_base + len(self._logs),
+        }
 
 
 class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
     manager: ClassVar[FlashManager]
+    # wfile is already an unbuffered socket writer; headers and body leave as two small sends,
+    # so keep Nagle from holding the body back until the client ACKs the headers.
+    disable_nagle_algorithm = True
+    # Keep-alive lets the page reuse one connection for lookups and polls; every response sets
+    # Content-Length (or has no body), and idle connections are dropped after `timeout` seconds.
+    protocol_version = "HTTP/1.1"
+    timeout = 60
 
     def do_GET(self) -> None:
         if self.path == "/" or self.path.startswith("/?"):
-            self._send_response(200, INDEX_HTML.encode("utf-8"), "text/html; charset=utf-8")
+            self._handle_index()
         elif self.path.startswith("/state"):
-            payload = json.dumps(self.manager.state()).encode("utf-8")
-            self._send_response(200, payload, "application/json")
+            self._handle_state()
+        elif self.path.startswith("/ws"):
+            self._handle_websocket()
         elif self.path.startswith("/lookup"):
             self._handle_lookup()
         elif self.path.startswith("/ports"):
@@ -658,13 +605,13 @@ class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
             return
         length = int(self.headers.get("Content-Length", "0"))
         body = self.rfile.read(length).decode("utf-8")
-        data = urllib.parse.parse_qs(body)
         try:
-            batch = int(data.get("batch", [""])[0])
-            year = int(data.get("year", [""])[0])
-            month = int(data.get("month", [""])[0])
-            serial = int(data.get("serial", [""])[0])
-            port = data.get("port", [""])[0].strip()
+            data = dict(urllib.parse.parse_qsl(body, max_num_fields=8))
+            batch = int(data.get("batch", ""))
+            year = int(data.get("year", ""))
+            month = int(data.get("month", ""))
+            serial = int(data.get("serial", ""))
+            port = data.get("port", "").strip()
         except (TypeError, ValueError):
             self._json_response(
                 {"ok": False, "error": "Batch, year, month, and serial must be integers."},
@@ -679,35 +626,156 @@ class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
             payload["error"] = message
         self._json_response(payload, status=status_code)
 
+    def _handle_index(self) -> None:
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+            self._send_response(200, INDEX_HTML_GZIP, "text/html; charset=utf-8", headers=headers)
+        else:
+            headers = {"Vary": "Accept-Encoding"}
+            self._send_response(200, INDEX_HTML_BYTES, "text/html; charset=utf-8", headers=headers)
+
+    def _handle_state(self) -> None:
+        try:
+            params = dict(urllib.parse.parse_qsl(self.path.partition("?")[2], max_num_fields=8))
+            wait = min(float(params.get("wait", "0")), STATE_WAIT_MAX)
+        except ValueError:
+            wait = 0.0
+        if_none_match = self.headers.get("If-None-Match", "")
+        version = self.manager.version
+        # Long-poll: a client that is already current waits for the next change instead of re-polling.
+        if wait > 0 and etag_matches(if_none_match, f'"{version}"'):
+            version = self.manager.wait_changed(version, wait)
+        # Answer an up-to-date client before touching the cached body at all.
+        etag = f'"{version}"'
+        if etag_matches(if_none_match, etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            return
+        version, body = self.manager.state_bytes()
+        self._send_response(200, body, "application/json", headers={"ETag": f'"{version}"'})
+
+    def _handle_websocket(self) -> None:
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            self.send_error(400, "Expected a WebSocket upgrade")
+            return
+        # The page reconnects with the last log index it saw, so a dropped socket resumes with a delta.
+        try:
+            params = dict(urllib.parse.parse_qsl(self.path.partition("?")[2], max_num_fields=8))
+            cursor = int(params.get("since", "-1"))
+        except ValueError:
+            cursor = -1
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest())
+        self.close_connection = True
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+        self.end_headers()
+        # The idle keep-alive timeout does not apply once the socket carries WebSocket frames.
+        self.connection.settimeout(None)
+
+        send_lock = threading.Lock()
+        disconnected = threading.Event()
+
+        def send(opcode: int, payload: bytes) -> None:
+            with send_lock:
+                self.wfile.write(websocket_frame(opcode, payload))
+
+        reader = threading.Thread(target=self._read_websocket, args=(send, disconnected), daemon=True)
+        reader.start()
+        version = -1
+        try:
+            while not disconnected.is_set():
+                version, cursor, body = self.manager.wait_delta_bytes(
+                    version, cursor, PUSH_KEEPALIVE, disconnected
+                )
+                if body is None:
+                    if self.manager.closed or disconnected.is_set():
+                        return
+                    send(WS_OPCODE_PING, b"")
+                else:
+                    send(WS_OPCODE_TEXT, body)
+        except OSError:
+            # Browser tab closed or navigated away.
+            pass
+        finally:
+            # Unblock the reader before finish() closes rfile underneath it.
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            reader.join()
+
+    def _read_websocket(self, send: Callable[[int, bytes], None], disconnected: threading.Event) -> None:
+        """Answer pings and the close handshake until the client goes away."""
+        try:
+            while True:
+                header = self.rfile.read(2)
+                if len(header) < 2:
+                    break
+                opcode = header[0] & 0x0F
+                length = header[1] & 0x7F
+                if length == 126:
+                    length = int.from_bytes(self.rfile.read(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(self.rfile.read(8), "big")
+                if length > 65536:
+                    # The page never sends data frames; anything this large is not ours.
+                    break
+                mask = self.rfile.read(4) if header[1] & 0x80 else b""
+                payload = self.rfile.read(length)
+                if mask:
+                    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+                if opcode == WS_OPCODE_CLOSE:
+                    send(WS_OPCODE_CLOSE, payload[:2])
+                    break
+                if opcode == WS_OPCODE_PING:
+                    send(WS_OPCODE_PONG, payload)
+        except OSError:
+            pass
+        finally:
+            disconnected.set()
+            self.manager.wake()
+
     def _handle_ports(self) -> None:
         ports = [{"path": "auto", "label": "Auto-detect"}]
-        for path in detect_serial_ports():
+        for path in cached_serial_ports():
             ports.append({"path": path, "label": path})
         self._json_response({"ok": True, "ports": ports})
 
     def _handle_lookup(self) -> None:
-        query = urllib.parse.urlparse(self.path).query
-        params = urllib.parse.parse_qs(query)
         try:
-            batch = int(params.get("batch", [""])[0])
-            serial = int(params.get("serial", [""])[0])
-            year = int(params.get("year", [""])[0])
-            month = int(params.get("month", [""])[0])
-            unit = PASSWORD_DB.lookup(batch, serial, year, month)
+            params = dict(urllib.parse.parse_qsl(self.path.partition("?")[2], max_num_fields=8))
+            batch = int(params.get("batch", ""))
+            serial = int(params.get("serial", ""))
+            year = int(params.get("year", ""))
+            month = int(params.get("month", ""))
+            body = lookup_json(batch, serial, year, month)
         except (ValueError, TypeError) as exc:
             self._json_response({"ok": False, "error": str(exc)}, status=400)
             return
-        self._json_response({"ok": True, **unit})
+        self._send_response(200, body, "application/json")
 
     def _json_response(self, payload: dict[str, object], status: int = 200) -> None:
-        body = json.dumps(payload).encode("utf-8")
+        body = dump_json(payload)
         self._send_response(status, body, "application/json")
 
-    def _send_response(self, status: int, body: bytes, content_type: str) -> None:
+    def _send_response(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str,
+        headers: dict[str, str] | None = None,
+    ) -> None:
         self.send_response(status)
         self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(body)))
         self.send_header("Cache-Control", "no-store")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(body)
 
@@ -715,11 +783,54 @@ class FlashRequestHandler(http.server.BaseHTTPRequestHandler):
         return
 
 
+class PooledHTTPServer(http.server.HTTPServer):
+    """HTTPServer that reuses a fixed pool of worker threads instead of one thread per request."""
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        handler_class: type[http.server.BaseHTTPRequestHandler],
+        max_workers: int = HTTP_WORKERS,
+    ) -> None:
+        super().__init__(server_address, handler_class)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http")
+        self._requests_lock = threading.Lock()
+        self._requests: set[socket.socket] = set()
+
+    def process_request(self, request, client_address) -> None:  # type: ignore[override]
+        with self._requests_lock:
+            self._requests.add(request)
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address) -> None:  # type: ignore[no-untyped-def]
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # noqa: BLE001
+            self.handle_error(request, client_address)
+        finally:
+            with self._requests_lock:
+                self._requests.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        # Idle keep-alive connections park a worker in readline(); shutting the
+        # sockets down lets those workers see EOF so the interpreter can exit.
+        with self._requests_lock:
+            requests = list(self._requests)
+        for request in requests:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._pool.shutdown(wait=False)
+
+
 def run_server() -> None:
     load_password_db()
     manager = FlashManager()
     FlashRequestHandler.manager = manager
-    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlashRequestHandler)
+    server = PooledHTTPServer(("127.0.0.1", 0), FlashRequestHandler)
     host, port = server.server_address
     url = f"http://{host}:{port}/"
     print(f"Controller flasher listening on {url}")
@@ -733,6 +844,8 @@ def run_server() -> None:
         print("\nStopping server...")
     finally:
         server.shutdown()
+        manager.close()
+        server.server_close()
 
 
 def main() -> None:
@@ -4,10 +4,11 @@
 from __future__ import annotations
 
 import argparse
-import binascii
 import os
+import re
 import struct
 import sys
+import zlib
 
 
 MAGIC = 0x46504346  # 'FCPF' => Factory Config Payload
@@ -17,14 +18,17 @@ PASSWORD_FIELD_LEN = 64
 RESERVED_LEN = 48
 HEADER_STRUCT = struct.Struct("<IHH")
 CRC_STRUCT = struct.Struct("<I")
+BODY_LEN = HEADER_STRUCT.size + SERIAL_FIELD_LEN + PASSWORD_FIELD_LEN + RESERVED_LEN
+PAYLOAD_LEN = BODY_LEN + CRC_STRUCT.size
+FILL_CHUNK_LEN = 0x10000
+# One C-level pass over the serial; a str.translate deletion table measured slower on typical
+# already-clean serials, since sub() with no matches returns almost immediately.
+SERIAL_DISALLOWED = re.compile(r"[^A-Za-z0-9_-]")
+PRINTABLE_ASCII = re.compile(r"[\x20-\x7e]*")
 
 
 def sanitize_serial(value: str) -> str:
-    filtered = []
-    for char in value:
-        if char.isalnum() or char in "_-":
-            filtered.append(char)
-    sanitized = "".join(filtered)[:28]
+    sanitized = SERIAL_DISALLOWED.sub("", value)[:28]
     if not sanitized:
         raise ValueError("Serial suffix must contain at least one valid character (alphanumeric/_/-).")
     return sanitized
@@ -33,7 +37,7 @@ def sanitize_serial(value: str) -> str:
 def validate_password(value: str) -> str:
     if not (8 <= len(value) <= 63):
         raise ValueError("Password must be between 8 and 63 characters.")
-    if any(ord(ch) < 32 or ord(ch) > 126 for ch in value):
+    if not PRINTABLE_ASCII.fullmatch(value):
         raise ValueError("Password must contain printable ASCII characters only.")
     return value
 
@@ -43,15 +47,17 @@ def build_payload(serial_suffix: str, password: str) -> bytes:
     serial_bytes = serial_suffix.encode("ascii")
     password_bytes = password.encode("ascii")
 
-    body = bytearray()
-    body.extend(HEADER_STRUCT.pack(MAGIC, VERSION, flags))
-    body.extend(serial_bytes.ljust(SERIAL_FIELD_LEN, b"\x00"))
-    body.extend(password_bytes.ljust(PASSWORD_FIELD_LEN, b"\x00"))
-    body.extend(b"\x00" * RESERVED_LEN)
+    # Single zero-filled buffer: field padding and the reserved block need no extra writes.
+    payload = bytearray(PAYLOAD_LEN)
+    HEADER_STRUCT.pack_into(payload, 0, MAGIC, VERSION, flags)
+    offset = HEADER_STRUCT.size
+    payload[offset : offset + len(serial_bytes)] = serial_bytes
+    offset += SERIAL_FIELD_LEN
+    payload[offset : offset + len(password_bytes)] = password_bytes
 
-    crc = binascii.crc32(body) & 0xFFFFFFFF
-    body.extend(CRC_STRUCT.pack(crc))
-    return bytes(body)
+    crc = zlib.crc32(memoryview(payload)[:BODY_LEN])
+    CRC_STRUCT.pack_into(payload, BODY_LEN, crc)
+    return bytes(payload)
 
 
 def main(argv: list[str]) -> int:
@@ -90,12 +96,15 @@ def main(argv: list[str]) -> int:
             "Increase the partition size."
         )
 
-    blob = bytearray(b"\xFF" * partition_size)
-    blob[: len(payload)] = payload
-
     os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    # Pad with erased-flash 0xFF from one reusable chunk instead of materializing the whole partition.
+    fill = memoryview(b"\xFF" * min(FILL_CHUNK_LEN, partition_size))
     with open(args.output, "wb") as fh:
-        fh.write(blob)
+        fh.write(payload)
+        remaining = partition_size - len(payload)
+        while remaining > 0:
+            written = fh.write(fill[:remaining])
+            remaining -= written
 
     print(
         f"Wrote factory payload: serial={serial_suffix} password_len={len(password)} "